@@ -9,6 +9,7 @@ import serial
 import time
 import re
 import os
+import threading
 import RPi.GPIO as GPIO
 
 logger = logging.getLogger("sim800")
@@ -18,16 +19,47 @@ class Sim800(object):
     GET=0
     POST=1
     HEAD=2
-    def __init__(self, device, resetPin=27, powerSupplyResetPin=22):
+    def __init__(self, device, resetPin=27, powerSupplyResetPin=22, smsStorage="ME", smsStorageHighWatermark=0.8, dtrPin=None):
         self.__device = device
         self.__serial = None
         self.__serialBaudrate = 9600
         self.__availableSms = []
+        self.__receivedSms = [] # SMS drained from module storage, not yet read by the caller
+        # SMS storage
+        self.__smsStorage = smsStorage
+        self.__smsStorageUsed = None
+        self.__smsStorageTotal = None
+        self.__smsStorageHighWatermark = smsStorageHighWatermark
+        self.__smsStorageCleanedAt = None # used count after the last cleanup that left storage full
         self.__serialReady = False
         self.__gsmReady = False
         self.__gprsReady = False
         self.__gprsBearerId = None
         self.__ipAddress = "0.0.0.0"
+        # serial port is shared between the caller and the network monitor thread
+        self.__lock = threading.RLock()
+        # network monitor
+        self.__networkState = {"rssi": None, "ber": None, "creg": None, "cgreg": None, "timestamp": None}
+        self.__monitorThread = None
+        self.__monitorStop = threading.Event()
+        self.__monitorInterval = 30
+        self.__minRssi = 10
+        self.__maxDeferral = 600
+        self.__deferredJobs = []
+        self.__httpActionTime = None # moving average of HTTPACTION duration (s)
+        # idle manager
+        self.__sleeping = False
+        self.__lastActivity = time.time()
+        self.__idleThread = None
+        self.__idleStop = threading.Event()
+        self.__quietPeriod = 30
+        self.__maxWakeLatency = None
+        self.__wakeLatency = None # moving average of wake latency (s)
+        self.__wakeLatencyMax = None
+        self.__recentWakeLatencies = [] # last wake latencies, checked against maxWakeLatency
+        self.__lastWake = None
+        self.__wakeCount = 0
+        self.__scheduledWakes = []
         # setup reset pin
         self.__resetPin = resetPin
         GPIO.setmode(GPIO.BCM)  
@@ -38,6 +70,11 @@ class Sim800(object):
         if self.__powerSupplyResetPin is not None:
             GPIO.setup(self.__powerSupplyResetPin, GPIO.OUT, pull_up_down=GPIO.PUD_OFF)
             GPIO.output(self.__powerSupplyResetPin, GPIO.LOW) # PS is OFF when pin is HIGH
+        # setup DTR pin, used to leave slow clock mode
+        self.__dtrPin = dtrPin
+        if self.__dtrPin is not None:
+            GPIO.setup(self.__dtrPin, GPIO.OUT, pull_up_down=GPIO.PUD_OFF)
+            GPIO.output(self.__dtrPin, GPIO.LOW) # module may sleep when DTR is HIGH
     
     def begin(self, device=None, baudrate=None, timeout=2):
         """ Open serial and start init procedure for Sim800L module:
@@ -58,6 +95,7 @@ class Sim800(object):
             self.__serialReady = True
         
         self.__resetPowerSupply() # Reset will re-enable unsollicited codes
+        self.__sleeping = False
         time.sleep(5)
         
         if not self.__gsmReady:
@@ -78,23 +116,32 @@ class Sim800(object):
         return False
 
     def stop(self):
-        self.__httpEnd()
-        if self.__gprsReady:
-            self.__attachGPRS(detach=True)
-            self.__gprsReady = False
-        if self.__gsmReady:
-            self.__setPhoneFunctionnalityState(False)
-            self.__gsmReady = False
-        self.__ipAddress = "0.0.0.0"
-        if self.__serialReady:
-            self.__serial.close()
-            self.__serialReady = False
+        self.stopNetworkMonitor()
+        self.stopIdleManager()
+        with self.__lock:
+            self.__httpEnd()
+            if self.__gprsReady:
+                self.__attachGPRS(detach=True)
+                self.__gprsReady = False
+            if self.__gsmReady:
+                self.__setPhoneFunctionnalityState(False)
+                self.__gsmReady = False
+            self.__ipAddress = "0.0.0.0"
+            if self.__serialReady:
+                self.__serial.close()
+                self.__serialReady = False
         return True
 
-    def available(self):
+    def available(self, timeout=None):
+        """ Returns the number of unread SMS
+        Param timeout: how long to wait for a new message indication,
+            defaults to the serial timeout
+        """
         if self.__gsmReady:
-            self.__checkNewSms()
-            return len(self.__availableSms)
+            with self.__lock:
+                self.__checkNewSms(timeout)
+                self.__manageStorage()
+                return len(self.__receivedSms) + len(self.__availableSms)
         else:
             logger.error("Trying to call available() while sim800 is not connected")
             return False
@@ -102,29 +149,17 @@ class Sim800(object):
     def readSms(self): 
         """reads the oldest unread sms and delete it from sim800 module"""
         if self.__gsmReady:
-            if self.available() > 0:
-                i = self.__availableSms[0]
-                del self.__availableSms[0]
-                tx = "AT+CMGR=%d,0" % i
-                self.__write(tx)
-                rx = self.__readline()
-                if tx in rx: # echo enabled ?
-                    rx = self.__readline()
-                m = re.search(r'(\+CMGR): [^,]*,"([^"]*)",".*"', rx)
-                if m:
-                    g = m.groups()
-                    resp = g[0]
-                    sender = g[1]
-                    text = self.__readline()
-                    atStatus = self.__checkStatus()
-                    if "CMGR" in resp and atStatus:
+            with self.__lock:
+                if self.__receivedSms or self.__availableSms or self.available() > 0:
+                    if self.__receivedSms:
+                        return self.__receivedSms.pop(0)
+                    i = self.__availableSms[0]
+                    del self.__availableSms[0]
+                    sms = self.__readSmsByIndex(i)
+                    if sms:
                         self.__deleteSmsByIndex(i)
-                        return {"sender": sender, "text": text}
-                    else:
-                        logger.error("Invalid response to AT+CMGR")
-                else:
-                    logger.error("readSms regex did not match CMGR response: %s", rx)
-            return None
+                        return sms
+                return None
         else:
             logger.error("Trying to call readSms() while sim800 is not connected")
             return False
@@ -133,23 +168,24 @@ class Sim800(object):
         """send sms and delete it from sim800 module"""
         if self.__gsmReady:
             logger.debug("Send SMS to %s", number)
-            if self.__setTextMode():
-                self.__write('AT+CMGS="%s"' % number)
-                response = self.__readline(5)
-                if ">" in response or "AT+CMGS" in response:
-                    self.__serial.reset_input_buffer()
-                    self.__write(text, end="")
-                    self.__serial.write(b'\x1A') # CTRL+Z
-                    if self.__checkStatus(timeout=10):
-                        logger.debug("SMS sent")
-                        return True
+            with self.__lock:
+                if self.__setTextMode():
+                    self.__write('AT+CMGS="%s"' % number)
+                    response = self.__readline(5)
+                    if ">" in response or "AT+CMGS" in response:
+                        self.__serial.reset_input_buffer()
+                        self.__write(text, end="")
+                        self.__serial.write(b'\x1A') # CTRL+Z
+                        if self.__checkStatus(timeout=self.__linkTimeout(10)):
+                            logger.debug("SMS sent")
+                            return True
+                        else:
+                            logger.error("Unable to send SMS")
                     else:
-                        logger.error("Unable to send SMS")
+                        self.__write("\x1b", end="") # ESC to cancel SMS sending
+                        logger.error("Failed to setup SMS sending")
                 else:
-                    self.__write("\x1b", end="") # ESC to cancel SMS sending
-                    logger.error("Failed to setup SMS sending")
-            else:
-                logger.error("Unable to set Text Mode")
+                    logger.error("Unable to set Text Mode")
             return False
         else:
             logger.error("Trying to call sendSms() while sim800 is not connected")
@@ -157,94 +193,205 @@ class Sim800(object):
 
     def flush(self):
         if self.__gsmReady:
-            return self.__deleteSms("ALL")
+            with self.__lock:
+                ret = self.__deleteSms("ALL")
+                self.__availableSms = []
+                self.__receivedSms = []
+                self.__smsStorageCleanedAt = None
+                self.__getStorageStatus()
+                return ret
         else:
             logger.error("Trying to call flush() while sim800 is not connected")
             return False
 
+    def setSmsStorage(self, storage):
+        """ Select the storage used to receive, read and delete SMS
+        Param storage:
+            ME: module memory
+            SM: SIM card
+        """
+        if not self.__gsmReady:
+            logger.error("Trying to call setSmsStorage() while sim800 is not connected")
+            return False
+        with self.__lock:
+            if not self.__switchStorage(storage):
+                return False
+            unread = self.__fetchSms("UNREAD")
+            self.__availableSms = unread if unread else []
+            return True
+
+    def getSmsStorage(self):
+        """ Returns a dict with:
+            storage: selected storage (ME or SM)
+            used: number of messages in storage
+            total: storage capacity
+            buffered: messages drained from storage, waiting for readSms()
+        """
+        if not self.__gsmReady:
+            logger.error("Trying to call getSmsStorage() while sim800 is not connected")
+            return False
+        with self.__lock:
+            self.__getStorageStatus()
+            return {"storage": self.__smsStorage, "used": self.__smsStorageUsed,
+                    "total": self.__smsStorageTotal, "buffered": len(self.__receivedSms)}
+
     def isOpen(self):
         return self.__gsmReady == True    
 
-    def httpGet(self, url):
+    def httpGet(self, url, deferrable=False, callback=None):
         """ Send GET request to url
         returns (status, data):
             status: HTTP error code
             data: Either None or a bytearray
+        Params:
+            * deferrable: if True and the network monitor reports a poor link,
+              the request is queued until the link is good and None is returned
+            * callback: called with (status, data) once the request is done
         """
-        if not self.__gsmReady:
-            logger.error("Trying to call httpGet() while sim800 is not connected")
-            return (0,0)
-        if not self.__gprsReady:
-            res = self.__setupGPRS()
-            if not res:
-                logger.error("Trying to use HTTP while GPRS is not configured")
-                return (0,0)
-        if not self.__httpInit():
-            logger.error("HTTP: init failed")
-            return (0,0)
-        if not self.__httpBindBearer():
-            logger.error("HTTP: Unable to bind bearer")
-            return (0,0)
-        if not self.__httpSetUrl(url=url):
-            logger.error("HTTP: Unable to setup URL")
-            return (0,0)
-        status, dataLength = self.__httpSendRequest(self.GET)
-        data = []
-        if not status:
-            logger.error("HTTP: Unable send GET request")
-            return (0,0)
-        elif status != 200:
-            logger.warning("HTTP: GET request returned %d" % status)
-        else:
-            ok, data = self.__httpReadData()
-            if not ok:
-                logger.error("HTTP: Failed to read GET response")
-                return (0,0)
-        self.__httpEnd()
-        return (status, data)
+        return self.__runTransfer(self.__httpGet, (url,), deferrable, callback)
 
-    def httpPost(self, url, data, contentType="text/plain"):
+    def httpPost(self, url, data, contentType="text/plain", deferrable=False, callback=None):
         """ Send POST request to url
         returns (status, data):
             status: HTTP error code
             data: Either None or a bytearray
+        Params:
+            * deferrable: if True and the network monitor reports a poor link,
+              the request is queued until the link is good and None is returned
+            * callback: called with (status, data) once the request is done
+        """
+        return self.__runTransfer(self.__httpPost, (url, data, contentType), deferrable, callback)
+
+    def startNetworkMonitor(self, interval=30, minRssi=10, maxDeferral=600):
+        """ Start a background thread polling signal quality (AT+CSQ) and
+        network registration (AT+CREG?, AT+CGREG?)
+        Params:
+            * interval: polling period in seconds
+            * minRssi: lowest CSQ rssi (0-31) considered as a good link
+            * maxDeferral: deferred transfers are run anyway after this many seconds
         """
         if not self.__gsmReady:
-            logger.error("Trying to call httpPost() while sim800 is not connected")
-            return (0,0)
-        if not self.__gprsReady:
-            res = self.__setupGPRS()
-            if not res:
-                logger.error("Trying to use HTTP while GPRS is not configured")
-                return (0,0)
-        if not self.__httpInit():
-            logger.error("HTTP: init failed")
-            return (0,0)
-        if not self.__httpBindBearer():
-            logger.error("HTTP: Unable to bind bearer")
-            return (0,0)
-        if not self.__httpSetUrl(url=url):
-            logger.error("HTTP: Unable to setup URL")
-            return (0,0)
-        if not self.__httpSetPostData(data, contentType=contentType):
-            logger.error("HTTP: Unable to write post data")
-            return (0,0)
+            logger.error("Trying to call startNetworkMonitor() while sim800 is not connected")
+            return False
+        self.__monitorInterval = interval
+        self.__minRssi = minRssi
+        self.__maxDeferral = maxDeferral
+        if not self.__isMonitorRunning():
+            self.__monitorStop.clear()
+            self.__monitorThread = threading.Thread(target=self.__monitorLoop, name="sim800-monitor")
+            self.__monitorThread.daemon = True
+            self.__monitorThread.start()
+        return True
 
-        status, dataLength = self.__httpSendRequest(self.POST)
-        ok, data = self.__httpReadData() # debug
-        data = []
-        if not status:
-            logger.error("HTTP: Unable send POST request")
-            return (0,0)
-        elif status != 200:
-            logger.warning("HTTP: POST request returned %d" % status)
-        else:
-            ok, data = self.__httpReadData()
-            if not ok:
-                logger.error("HTTP: Failed to read POST response")
-                return (0,0)
-        self.__httpEnd()
-        return (status, data)
+    def stopNetworkMonitor(self):
+        """Stop the monitor thread, pending deferred transfers fail with (0, 0)"""
+        if self.__monitorThread is not None:
+            self.__monitorStop.set()
+            if self.__monitorThread is not threading.current_thread():
+                self.__monitorThread.join()
+            self.__monitorThread = None
+        with self.__lock:
+            jobs = self.__deferredJobs
+            self.__deferredJobs = []
+        for queuedAt, transfer, args, callback in jobs:
+            logger.warning("Network monitor stopped: dropping deferred transfer")
+            if callback:
+                try:
+                    callback(0, 0)
+                except Exception:
+                    logger.exception("Deferred transfer callback failed")
+        return True
+
+    def getNetworkState(self, refresh=False):
+        """ Returns the last known link state as a dict:
+            rssi: 0-31 (higher is better), 99: not detectable, None: never polled
+            ber: bit error rate 0-7, 99: not detectable
+            creg, cgreg: GSM and GPRS registration status
+                0: not registered
+                1: registered, home network
+                2: searching
+                3: registration denied
+                4: unknown
+                5: registered, roaming
+            timestamp: time of the last poll
+            linkGood: True if transfers can run now
+            httpActionTime: average HTTP request duration in seconds
+            deferred: number of transfers waiting for a good link
+        Param refresh: poll the module instead of returning cached values
+        """
+        if refresh:
+            if not self.__gsmReady:
+                logger.error("Trying to refresh network state while sim800 is not connected")
+            else:
+                with self.__lock:
+                    self.__pollNetworkState()
+        with self.__lock:
+            state = dict(self.__networkState)
+            state["linkGood"] = self.__isLinkGood()
+            state["httpActionTime"] = self.__httpActionTime
+            state["deferred"] = len(self.__deferredJobs)
+        return state
+
+    def isLinkGood(self):
+        with self.__lock:
+            return self.__isLinkGood()
+
+    def startIdleManager(self, quietPeriod=30, maxWakeLatency=None):
+        """ Put the module in slow clock mode (AT+CSCLK) after quietPeriod seconds
+        without command. The module is woken up before the next command, using
+        the DTR pin if configured, or by sending characters on the serial line.
+        Params:
+            * quietPeriod: idle time in seconds before entering slow clock mode
+            * maxWakeLatency: if set, slow clock mode is suspended when the last
+              wake latency (seconds) exceeded this bound. A new attempt is made
+              after 10 quiet periods, so the module sleeps again once the latency
+              is back within the bound
+        """
+        if not self.__gsmReady:
+            logger.error("Trying to call startIdleManager() while sim800 is not connected")
+            return False
+        self.__quietPeriod = quietPeriod
+        self.__maxWakeLatency = maxWakeLatency
+        if not self.__isIdleManagerRunning():
+            self.__idleStop.clear()
+            self.__idleThread = threading.Thread(target=self.__idleLoop, name="sim800-idle")
+            self.__idleThread.daemon = True
+            self.__idleThread.start()
+        return True
+
+    def stopIdleManager(self):
+        if self.__idleThread is not None:
+            self.__idleStop.set()
+            if self.__idleThread is not threading.current_thread():
+                self.__idleThread.join()
+            self.__idleThread = None
+        with self.__lock:
+            if self.__sleeping:
+                self.__wake()
+        return True
+
+    def scheduleWake(self, at):
+        """ Wake the module up ahead of time, so it is ready at timestamp `at`
+        (eg. before queued work). The observed wake latency is taken into account.
+        """
+        with self.__lock:
+            self.__scheduledWakes.append(at)
+            self.__scheduledWakes.sort()
+        return True
+
+    def getIdleState(self):
+        """ Returns a dict with:
+            sleeping: True if the module is in slow clock mode
+            idleFor: seconds since the last command
+            wakeLatency: average time (s) to get the module responsive again
+            wakeLatencyMax: worst observed wake latency (s)
+            recentWakeLatencies: last 3 wake latencies (s)
+            wakeCount: number of wake ups
+        """
+        with self.__lock:
+            return {"sleeping": self.__sleeping, "idleFor": time.time() - self.__lastActivity,
+                    "wakeLatency": self.__wakeLatency, "wakeLatencyMax": self.__wakeLatencyMax,
+                    "recentWakeLatencies": list(self.__recentWakeLatencies), "wakeCount": self.__wakeCount}
 
 ##################################################################
 #                         Private methods                        #
@@ -304,14 +451,19 @@ class Sim800(object):
 #                            GSM methods                         #
 ##################################################################
 
-    def __checkNewSms(self):
-        s = self.__readline()
+    def __checkNewSms(self, timeout=None):
+        self.__parseNewSms(self.__readline(timeout))
+
+    def __parseNewSms(self, s):
         if len(s) > 0:
             m = re.search(r"\+CMTI:.*,([0-9]+)", s)
             if m:
                 index = int(m.groups()[0])
                 logger.info("New message available at %d" % index)
-                self.__availableSms.append(index)
+                if index not in self.__availableSms:
+                    self.__availableSms.append(index)
+                    if self.__smsStorageUsed is not None:
+                        self.__smsStorageUsed += 1
 
     def __setupGSM(self):
         logger.info("Setup GSM")
@@ -338,11 +490,16 @@ class Sim800(object):
             logger.error("Unable to enable new message indication")
             return False
 
-        for status in ["READ", "SENT", "UNSENT"]:
-            if self.__fetchSms(status) != True:
-                if not self.__deleteSms(status):
-                    logger.error("Unable to delete %s SMS" % status)
-                    return False
+        if not self.__switchStorage(self.__smsStorage):
+            if self.__smsStorage == "SM" or not self.__switchStorage("SM"):
+                logger.error("Unable to set SMS storage")
+                return False
+            logger.warning("Falling back to SIM SMS storage")
+
+        if not self.__cleanStorage():
+            return False
+        if not self.__getStorageStatus():
+            logger.warning("Unable to read SMS storage capacity")
 
         unread = self.__fetchSms("UNREAD")
         if unread is False:
@@ -351,6 +508,7 @@ class Sim800(object):
         else:
             self.__availableSms = unread
             logger.info("%d Unread SMS" % len(unread))
+        self.__manageStorage()
         logger.debug("Sim800 setup success")
         return True
 
@@ -422,7 +580,12 @@ class Sim800(object):
         return self.__checkStatus()
 
     def __setSlowClockState(self, state=True):
-        self.__write("AT+CSCLK=%d" % (1 if state else 0))
+        """ Param state:
+            0 (False): disabled
+            1 (True): module sleeps while DTR is HIGH
+            2: module sleeps when the serial line is idle, wakes on incoming characters
+        """
+        self.__write("AT+CSCLK=%d" % int(state))
         return self.__checkStatus()
 
     def __deleteSms(self, status):
@@ -441,7 +604,119 @@ class Sim800(object):
 
     def __deleteSmsByIndex(self, index):
         self.__write('AT+CMGD=%d' % index)
-        return self.__checkStatus()
+        if self.__checkStatus():
+            if self.__smsStorageUsed:
+                self.__smsStorageUsed -= 1
+            return True
+        return False
+
+    def __readSmsByIndex(self, index):
+        """Read sms at index, returns a dict with sender and text or None"""
+        tx = "AT+CMGR=%d,0" % index
+        self.__write(tx)
+        rx = self.__readline()
+        if tx in rx: # echo enabled ?
+            rx = self.__readline()
+        m = re.search(r'(\+CMGR): [^,]*,"([^"]*)",".*"', rx)
+        if m:
+            g = m.groups()
+            resp = g[0]
+            sender = g[1]
+            text = self.__readline()
+            atStatus = self.__checkStatus()
+            if "CMGR" in resp and atStatus:
+                return {"sender": sender, "text": text}
+            else:
+                logger.error("Invalid response to AT+CMGR")
+        else:
+            logger.error("readSms regex did not match CMGR response: %s", rx)
+        return None
+
+    def __setPreferredStorage(self, storage="ME"):
+        """Use storage (ME or SM) to read, write and receive SMS"""
+        self.__write('AT+CPMS="%s","%s","%s"' % (storage, storage, storage))
+        r = self.__waitFor(r'\+CPMS: ([0-9]+),([0-9]+)', regex=True)
+        if self.__checkStatus() and r:
+            self.__smsStorage = storage
+            self.__smsStorageUsed = int(r[0])
+            self.__smsStorageTotal = int(r[1])
+            logger.info("SMS storage %s: %d/%d" % (storage, self.__smsStorageUsed, self.__smsStorageTotal))
+            return True
+        logger.error("Unable to select %s SMS storage" % storage)
+        return False
+
+    def __getStorageStatus(self):
+        """Refresh used and total capacity of the read storage, returns its name (SM or ME) or None"""
+        self.__write('AT+CPMS?')
+        r = self.__waitFor(r'\+CPMS: "([A-Z]+)[A-Z_]*",([0-9]+),([0-9]+)', regex=True)
+        if self.__checkStatus() and r:
+            self.__smsStorageUsed = int(r[1])
+            self.__smsStorageTotal = int(r[2])
+            return r[0]
+        return None
+
+    def __switchStorage(self, storage):
+        """Select storage, after moving unread SMS of the current storage to the host side buffer"""
+        current = self.__getStorageStatus()
+        if current and current != storage:
+            self.__drainUnread(self.__fetchSms("UNREAD") or [])
+        self.__smsStorageCleanedAt = None
+        return self.__setPreferredStorage(storage)
+
+    def __drainUnread(self, indexes):
+        """Move SMS at indexes to the host side buffer, returns the indexes left in storage"""
+        indexes = list(indexes)
+        while indexes:
+            sms = self.__readSmsByIndex(indexes[0])
+            if not sms:
+                break
+            self.__receivedSms.append(sms)
+            self.__deleteSmsByIndex(indexes.pop(0))
+        return indexes
+
+    def __cleanStorage(self):
+        """Delete read, sent and unsent SMS, which are never used by this library"""
+        for status in ["READ", "SENT", "UNSENT"]:
+            if not self.__deleteSms(status):
+                logger.error("Unable to delete %s SMS" % status)
+                return False
+        return True
+
+    def __isStorageFull(self):
+        if not self.__smsStorageTotal or self.__smsStorageUsed is None:
+            return False
+        return self.__smsStorageUsed >= self.__smsStorageHighWatermark * self.__smsStorageTotal
+
+    def __manageStorage(self):
+        """ Keep the storage below its high watermark so incoming SMS are not rejected:
+        1. delete read, sent and unsent SMS
+        2. move the oldest unread SMS to the host side buffer
+        """
+        if not self.__isStorageFull():
+            self.__smsStorageCleanedAt = None
+            return True
+        if self.__smsStorageUsed == self.__smsStorageCleanedAt:
+            return False # nothing changed since the last attempt, keep the serial line quiet
+        logger.warning("SMS storage almost full: %d/%d" % (self.__smsStorageUsed, self.__smsStorageTotal))
+        self.__cleanStorage()
+        self.__getStorageStatus()
+        if self.__isStorageFull() and not self.__availableSms:
+            # unread SMS whose new message indication was missed
+            unread = self.__fetchSms("UNREAD")
+            if unread:
+                self.__availableSms = unread
+        while self.__isStorageFull() and self.__availableSms:
+            left = self.__drainUnread(self.__availableSms[:1])
+            if left:
+                break
+            del self.__availableSms[0]
+        if self.__isStorageFull():
+            self.__getStorageStatus()
+        if self.__isStorageFull():
+            self.__smsStorageCleanedAt = self.__smsStorageUsed
+            return False
+        self.__smsStorageCleanedAt = None
+        return True
 
     def __enableNewMessageIndication(self):
         self.__write('AT+CNMI=1')
@@ -473,7 +748,8 @@ class Sim800(object):
                 time.sleep(1)
                 # wait for connection (ie. bearerStatus = 1)
                 start = time.time()
-                while bearerStatus != 1 and time.time() - start < 10:
+                timeout = self.__linkTimeout(10)
+                while bearerStatus != 1 and time.time() - start < timeout:
                     cmdStatus, bearerId, bearerStatus, ipAddress = self.__getBearerSatus()
                     time.sleep(2)
             self.__ipAddress = ipAddress
@@ -554,6 +830,77 @@ class Sim800(object):
 #                           HTTP methods                         #
 ##################################################################
 
+    def __httpGet(self, url):
+        if not self.__gsmReady:
+            logger.error("Trying to call httpGet() while sim800 is not connected")
+            return (0,0)
+        if not self.__gprsReady:
+            res = self.__setupGPRS()
+            if not res:
+                logger.error("Trying to use HTTP while GPRS is not configured")
+                return (0,0)
+        if not self.__httpInit():
+            logger.error("HTTP: init failed")
+            return (0,0)
+        if not self.__httpBindBearer():
+            logger.error("HTTP: Unable to bind bearer")
+            return (0,0)
+        if not self.__httpSetUrl(url=url):
+            logger.error("HTTP: Unable to setup URL")
+            return (0,0)
+        status, dataLength = self.__httpSendRequest(self.GET)
+        data = []
+        if not status:
+            logger.error("HTTP: Unable send GET request")
+            return (0,0)
+        elif status != 200:
+            logger.warning("HTTP: GET request returned %d" % status)
+        else:
+            ok, data = self.__httpReadData()
+            if not ok:
+                logger.error("HTTP: Failed to read GET response")
+                return (0,0)
+        self.__httpEnd()
+        return (status, data)
+
+    def __httpPost(self, url, data, contentType="text/plain"):
+        if not self.__gsmReady:
+            logger.error("Trying to call httpPost() while sim800 is not connected")
+            return (0,0)
+        if not self.__gprsReady:
+            res = self.__setupGPRS()
+            if not res:
+                logger.error("Trying to use HTTP while GPRS is not configured")
+                return (0,0)
+        if not self.__httpInit():
+            logger.error("HTTP: init failed")
+            return (0,0)
+        if not self.__httpBindBearer():
+            logger.error("HTTP: Unable to bind bearer")
+            return (0,0)
+        if not self.__httpSetUrl(url=url):
+            logger.error("HTTP: Unable to setup URL")
+            return (0,0)
+        if not self.__httpSetPostData(data, contentType=contentType):
+            logger.error("HTTP: Unable to write post data")
+            return (0,0)
+
+        status, dataLength = self.__httpSendRequest(self.POST)
+        ok, data = self.__httpReadData() # debug
+        data = []
+        if not status:
+            logger.error("HTTP: Unable send POST request")
+            return (0,0)
+        elif status != 200:
+            logger.warning("HTTP: POST request returned %d" % status)
+        else:
+            ok, data = self.__httpReadData()
+            if not ok:
+                logger.error("HTTP: Failed to read POST response")
+                return (0,0)
+        self.__httpEnd()
+        return (status, data)
+
     def __httpInit(self):
         self.__write('AT+HTTPINIT')
         if not self.__checkStatus():
@@ -584,7 +931,7 @@ class Sim800(object):
         return self.__checkStatus()
 
     def __httpSetPostData(self, data, contentType=None):
-        if isinstance(data, str) or isinstance(data, unicode):
+        if isinstance(data, (str, type(u""))):
             serialData = bytearray(data, "utf-8")
             if not contentType:
                 contentType = "text/plain"
@@ -622,13 +969,28 @@ class Sim800(object):
             1: POST
             2: HEAD
         """
+        # wait for 3 times the usual request duration (at least 20s), scaled to the link quality
+        timeout = 20
+        if self.__httpActionTime:
+            timeout = max(20, 3 * self.__httpActionTime)
+        timeout = min(self.__linkTimeout(timeout), 120)
+        start = time.time()
         self.__write('AT+HTTPACTION=%d' % requestType)
         if self.__checkStatus():
-            r = self.__waitFor(r"\+HTTPACTION: ?[012],([0-9]+),([0-9]*)", timeout=20, regex=True)
+            r = self.__waitFor(r"\+HTTPACTION: ?[012],([0-9]+),([0-9]*)", timeout=timeout, regex=True)
             if r:
+                self.__updateHttpActionTime(time.time() - start)
                 return (int(r[0]), int(r[1])) # (status, data length)
+            logger.warning("HTTP: no response after %ds" % timeout)
+            self.__updateHttpActionTime(timeout) # widen the next timeout
         return (0, 0)
 
+    def __updateHttpActionTime(self, duration):
+        if self.__httpActionTime is None:
+            self.__httpActionTime = duration
+        else:
+            self.__httpActionTime = 0.8 * self.__httpActionTime + 0.2 * duration
+
     def __httpReadData(self):
         self.__write('AT+HTTPREAD')
         r = self.__waitFor(r"HTTPREAD: ([0-9]+)", regex=True)
@@ -646,13 +1008,220 @@ class Sim800(object):
 
     
     
+##################################################################
+#                         Network monitor                        #
+##################################################################
+
+    def __isMonitorRunning(self):
+        return self.__monitorThread is not None and self.__monitorThread.is_alive()
+
+    def __monitorLoop(self):
+        logger.info("Network monitor started")
+        while not self.__monitorStop.is_set():
+            if self.__gsmReady and (not self.__sleeping or self.__deferredJobs):
+                with self.__lock:
+                    lastActivity = self.__lastActivity # polling does not prevent slow clock mode
+                    self.__pollNetworkState()
+                    if not self.__hasDueDeferredJobs():
+                        self.__lastActivity = lastActivity
+                self.__runDeferredJobs()
+            if self.__deferredJobs and self.__isIdleManagerRunning():
+                # have the module awake for the next poll
+                self.scheduleWake(time.time() + self.__monitorInterval)
+            self.__monitorStop.wait(self.__monitorInterval)
+        logger.info("Network monitor stopped")
+
+    def __pollNetworkState(self):
+        rssi, ber = self.__getSignalQuality()
+        self.__networkState["rssi"] = rssi
+        self.__networkState["ber"] = ber
+        self.__networkState["creg"] = self.__getRegistrationStatus("CREG")
+        self.__networkState["cgreg"] = self.__getRegistrationStatus("CGREG")
+        self.__networkState["timestamp"] = time.time()
+        logger.debug("Network state: %s" % self.__networkState)
+
+    def __getSignalQuality(self):
+        """ Returns (rssi, ber), or (None, None) on error """
+        self.__write('AT+CSQ')
+        r = self.__waitFor(r'\+CSQ: ([0-9]+),([0-9]+)', regex=True)
+        if self.__checkStatus() and r:
+            return (int(r[0]), int(r[1]))
+        return (None, None)
+
+    def __getRegistrationStatus(self, command="CREG"):
+        """ Param command:
+            CREG: GSM network registration
+            CGREG: GPRS network registration
+        """
+        self.__write('AT+%s?' % command)
+        r = self.__waitFor(r'\+%s: [0-9]+,([0-9]+)' % command, regex=True)
+        if self.__checkStatus() and r:
+            return int(r[0])
+        return None
+
+    def __isLinkGood(self):
+        state = self.__networkState
+        if state["timestamp"] is None:
+            return True # never polled: assume good, as without monitor
+        if state["creg"] not in (1, 5) or state["cgreg"] not in (1, 5):
+            return False
+        return state["rssi"] is not None and state["rssi"] != 99 and state["rssi"] >= self.__minRssi
+
+    def __linkTimeout(self, timeout):
+        """Scale a nominal timeout (seconds) to the last observed signal quality"""
+        if self.__networkState["timestamp"] is None: # never polled
+            return timeout
+        rssi = self.__networkState["rssi"]
+        if rssi is None or rssi == 99: # failed poll or not detectable: poor link
+            return timeout * 3
+        if rssi >= 20:
+            return timeout
+        if rssi >= self.__minRssi:
+            return timeout * 1.5
+        return timeout * 2
+
+    def __runTransfer(self, transfer, args, deferrable=False, callback=None):
+        if deferrable and self.__isMonitorRunning() and not self.isLinkGood():
+            logger.info("Poor link: transfer deferred")
+            with self.__lock:
+                queuedAt = time.time()
+                self.__deferredJobs.append((queuedAt, transfer, args, callback))
+            if self.__isIdleManagerRunning():
+                # deferred transfers run at the latest after maxDeferral
+                self.scheduleWake(queuedAt + self.__maxDeferral)
+            return None
+        with self.__lock:
+            result = transfer(*args)
+        if callback:
+            callback(*result)
+        return result
+
+    def __hasDueDeferredJobs(self):
+        if not self.__deferredJobs:
+            return False
+        queuedAt = self.__deferredJobs[0][0]
+        return self.__isLinkGood() or time.time() - queuedAt >= self.__maxDeferral
+
+    def __runDeferredJobs(self):
+        while self.__deferredJobs and not self.__monitorStop.is_set():
+            with self.__lock:
+                if not self.__hasDueDeferredJobs():
+                    return
+                queuedAt, transfer, args, callback = self.__deferredJobs[0]
+                del self.__deferredJobs[0]
+                logger.info("Running deferred transfer queued %ds ago" % (time.time() - queuedAt))
+                try:
+                    result = transfer(*args)
+                except Exception:
+                    logger.exception("Deferred transfer failed")
+                    result = (0, 0)
+            if callback:
+                try:
+                    callback(*result)
+                except Exception:
+                    logger.exception("Deferred transfer callback failed")
+
+##################################################################
+#                          Idle manager                          #
+##################################################################
+
+    def __isIdleManagerRunning(self):
+        return self.__idleThread is not None and self.__idleThread.is_alive()
+
+    def __idleLoop(self):
+        logger.info("Idle manager started")
+        while not self.__idleStop.is_set():
+            with self.__lock:
+                now = time.time()
+                nextWake = self.__nextScheduledWake(now)
+                if self.__sleeping:
+                    if nextWake is not None and now >= nextWake - (self.__wakeLatency or 0):
+                        logger.debug("Scheduled wake up")
+                        self.__wake()
+                elif self.__gsmReady and now - self.__lastActivity >= self.__quietPeriod:
+                    if nextWake is None or nextWake - now > self.__quietPeriod:
+                        if self.__isWakeLatencyAcceptable():
+                            self.__enterSlowClock()
+            self.__idleStop.wait(0.5)
+        logger.info("Idle manager stopped")
+
+    def __nextScheduledWake(self, now):
+        # drop wake ups the module is already awake for
+        while self.__scheduledWakes and not self.__sleeping and self.__scheduledWakes[0] <= now:
+            del self.__scheduledWakes[0]
+        return self.__scheduledWakes[0] if self.__scheduledWakes else None
+
+    def __isWakeLatencyAcceptable(self):
+        if self.__maxWakeLatency is None or not self.__recentWakeLatencies:
+            return True
+        if self.__recentWakeLatencies[-1] <= self.__maxWakeLatency:
+            return True
+        # retry from time to time, so the latency estimate can recover
+        return time.time() - self.__lastWake >= 10 * self.__quietPeriod
+
+    def __enterSlowClock(self):
+        if self.__dtrPin is not None:
+            if not self.__setSlowClockState(1):
+                logger.error("Unable to enable slow clock")
+                return False
+            GPIO.output(self.__dtrPin, GPIO.HIGH)
+        elif not self.__setSlowClockState(2):
+            logger.error("Unable to enable slow clock")
+            return False
+        logger.debug("Entering slow clock mode")
+        self.__sleeping = True
+        return True
+
+    def __wake(self):
+        self.__sleeping = False # allow __write while waking up
+        start = time.time()
+        if self.__dtrPin is not None:
+            GPIO.output(self.__dtrPin, GPIO.LOW)
+            time.sleep(0.05)
+        else:
+            self.__write("AT") # first characters only wake the module up and are lost
+            time.sleep(0.1)
+            # skip the garbage, but keep new SMS indications received while asleep
+            line = self.__readline(timeout=0.1)
+            while line:
+                self.__parseNewSms(line)
+                line = self.__readline(timeout=0.1)
+        awake = self.__ping()
+        while not awake and time.time() - start < 5:
+            awake = self.__ping()
+        if not awake:
+            logger.error("Module did not wake up")
+            self.__sleeping = True
+            return False
+        latency = time.time() - start
+        if self.__dtrPin is None:
+            self.__setSlowClockState(0) # otherwise the module sleeps again as soon as serial is idle
+        if self.__wakeLatency is None:
+            self.__wakeLatency = latency
+        else:
+            self.__wakeLatency = 0.8 * self.__wakeLatency + 0.2 * latency
+        self.__wakeLatencyMax = max(latency, self.__wakeLatencyMax or 0)
+        self.__recentWakeLatencies = (self.__recentWakeLatencies + [latency])[-3:]
+        self.__lastWake = time.time()
+        self.__wakeCount += 1
+        logger.debug("Module woke up in %.3fs" % latency)
+        if latency > (self.__maxWakeLatency or latency):
+            logger.warning("Wake latency %.3fs exceeds %.3fs, slow clock suspended"
+                           % (latency, self.__maxWakeLatency))
+        return True
+
 ##################################################################
 #                            UTILITIES                           #
 ##################################################################
 
     def __write(self, s, end="\r"):
+        if self.__sleeping and not self.__wake():
+            logger.error("Module is asleep, command not sent: %s" % s)
+            return False
+        self.__lastActivity = time.time()
         logger.debug(b"WRITE:" + bytearray(s+end, "utf-8"))
         self.__serial.write(bytearray(s+end, "utf-8"))
+        return True
 
     def __readline(self, timeout=None):
         if timeout:
@@ -683,6 +1252,7 @@ class Sim800(object):
         Returns: the matching response, or None
         Info:
             * This methos will throw away everithing send by the module until match or timeout
+              (except new SMS indications)
             * Remove all \r\n
         """
         if not isinstance(responses, list):
@@ -701,6 +1271,7 @@ class Sim800(object):
                 else:
                     if resp == expected:
                         return resp
+            self.__parseNewSms(resp) # do not lose new SMS indications
         return None
 
     def __checkStatus(self, timeout=None):
@@ -0,0 +1,461 @@
+#!/usr/bin/python
+# coding: utf-8
+
+""" Share one or more Sim800 modems between local processes.
+
+The broker owns the modems and serves clients over a Unix domain socket.
+Every frame is a 4 bytes big-endian length followed by a UTF-8 JSON object.
+
+Requests:   {"id": 1, "op": "sendSms", "modem": "gsm0", "number": "...", "text": "..."}
+Responses:  {"id": 1, "ok": true, "result": ...}
+            {"id": 1, "ok": false, "error": "..."}
+Events:     {"event": "sms", "modem": "gsm0", "sender": "...", "text": "..."}
+
+"modem" is optional and defaults to the first modem. Clients may send several
+requests without waiting: each modem runs its requests in order and responses
+carry the request id. HTTP bodies are base64 encoded ("data").
+
+Operations:
+    modems
+    available
+    readSms
+    sendSms: number, text
+    httpGet: url, deferrable
+    httpPost: url, data, contentType, deferrable
+    networkState: refresh
+    subscribe / unsubscribe: receive incoming SMS as events
+"""
+
+from __future__ import print_function
+
+import argparse
+import base64
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logger = logging.getLogger("sim800.broker")
+
+MAX_FRAME = 1024 * 1024
+HEADER = struct.Struct("!I")
+
+
+def sendFrame(sock, message):
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recvFrame(sock):
+    """Returns the next decoded message, or None if the peer closed the socket"""
+    header = _recvExactly(sock, HEADER.size)
+    if header is None:
+        return None
+    length = HEADER.unpack(header)[0]
+    if length > MAX_FRAME:
+        raise ValueError("Frame too large: %d bytes" % length)
+    payload = _recvExactly(sock, length)
+    if payload is None:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+
+def _recvExactly(sock, length):
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _encodeData(data):
+    if not data:
+        return None
+    return base64.b64encode(bytes(data)).decode("ascii")
+
+
+class _Connection(object):
+    """A connected client, as seen by the broker"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.__lock = threading.Lock()
+        self.closed = False
+
+    def send(self, message):
+        with self.__lock:
+            if self.closed:
+                return False
+            try:
+                sendFrame(self.sock, message)
+                return True
+            except socket.error as e:
+                logger.warning("Unable to send to client: %s" % e)
+                self.closed = True
+                return False
+
+
+class _ModemWorker(object):
+    """Runs requests for one modem in order and fans out incoming SMS"""
+    def __init__(self, name, modem, pollInterval=1):
+        self.name = name
+        self.modem = modem
+        self.pollInterval = pollInterval
+        self.subscribers = set()
+        self.__queue = queue.Queue()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__loop, name="sim800-broker-%s" % name)
+        self.__thread.daemon = True
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        self.__thread.join()
+
+    def submit(self, connection, request):
+        self.__queue.put((connection, request))
+
+    def __loop(self):
+        lastDispatch = time.time()
+        while not self.__stop.is_set():
+            try:
+                try:
+                    connection, request = self.__queue.get(timeout=self.pollInterval)
+                    self.__handle(connection, request)
+                except queue.Empty:
+                    pass
+                # also poll between requests, so SMS are delivered under steady traffic
+                if time.time() - lastDispatch >= self.pollInterval:
+                    lastDispatch = time.time()
+                    self.__dispatchSms()
+            except Exception as e:
+                logger.exception("Modem %s failed" % self.name)
+                self.__failQueued("Modem %s failed: %s" % (self.name, e))
+        self.__failQueued("Broker stopped")
+
+    def __failQueued(self, error):
+        while True:
+            try:
+                connection, request = self.__queue.get_nowait()
+            except queue.Empty:
+                return
+            connection.send({"id": request.get("id"), "ok": False, "error": error})
+
+    def __dispatchSms(self):
+        self.subscribers = set(c for c in self.subscribers if not c.closed)
+        if not self.subscribers:
+            return
+        # short timeout: do not hold the modem while nothing is pending
+        count = self.modem.available(timeout=0.05)
+        while count:
+            count -= 1
+            sms = self.modem.readSms()
+            if not sms:
+                break
+            event = {"event": "sms", "modem": self.name, "sender": sms["sender"], "text": sms["text"]}
+            for connection in list(self.subscribers):
+                connection.send(event)
+
+    def __handle(self, connection, request):
+        requestId = request.get("id")
+        op = request.get("op")
+
+        def reply(result):
+            connection.send({"id": requestId, "ok": True, "result": result})
+
+        def replyHttp(status, data):
+            reply({"status": status, "data": _encodeData(data)})
+
+        try:
+            if op == "available":
+                reply(self.modem.available())
+            elif op == "readSms":
+                reply(self.modem.readSms())
+            elif op == "sendSms":
+                reply(self.modem.sendSms(request["number"], request["text"]))
+            elif op == "httpGet":
+                self.modem.httpGet(request["url"], deferrable=request.get("deferrable", False),
+                                   callback=replyHttp)
+            elif op == "httpPost":
+                data = base64.b64decode(request.get("data") or "")
+                self.modem.httpPost(request["url"], data,
+                                    contentType=request.get("contentType", "application/octet-stream"),
+                                    deferrable=request.get("deferrable", False), callback=replyHttp)
+            elif op == "networkState":
+                reply(self.modem.getNetworkState(refresh=request.get("refresh", False)))
+            elif op == "subscribe":
+                self.subscribers.add(connection)
+                reply(True)
+            elif op == "unsubscribe":
+                self.subscribers.discard(connection)
+                reply(True)
+            else:
+                connection.send({"id": requestId, "ok": False, "error": "Unknown operation: %s" % op})
+        except Exception as e:
+            logger.exception("Request %s failed" % op)
+            connection.send({"id": requestId, "ok": False, "error": str(e)})
+
+
+class Sim800Broker(object):
+    def __init__(self, path, modems):
+        """ Params:
+            * path: Unix socket path
+            * modems: list of (name, Sim800) tuples, the first one is the default
+        """
+        self.__path = path
+        self.__workers = [_ModemWorker(name, modem) for name, modem in modems]
+        self.__workersByName = dict((w.name, w) for w in self.__workers)
+        self.__socket = None
+        self.__running = False
+
+    def begin(self, timeout=2):
+        """Start all modems, then listen for clients"""
+        for worker in self.__workers:
+            if not worker.modem.isOpen() and not worker.modem.begin(timeout=timeout):
+                logger.error("Unable to start modem %s" % worker.name)
+                return False
+        if os.path.exists(self.__path):
+            os.unlink(self.__path)
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.bind(self.__path)
+        os.chmod(self.__path, 0o660)
+        self.__socket.listen(8)
+        for worker in self.__workers:
+            worker.start()
+        self.__running = True
+        logger.info("Broker listening on %s" % self.__path)
+        return True
+
+    def serveForever(self):
+        while self.__running:
+            try:
+                sock, address = self.__socket.accept()
+            except socket.error:
+                if not self.__running:
+                    break
+                raise
+            thread = threading.Thread(target=self.__serveClient, args=(_Connection(sock),))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.__running = False
+        if self.__socket is not None:
+            try:
+                self.__socket.shutdown(socket.SHUT_RDWR) # unblock accept()
+            except socket.error:
+                pass
+            self.__socket.close()
+            self.__socket = None
+        if os.path.exists(self.__path):
+            os.unlink(self.__path)
+        for worker in self.__workers:
+            worker.stop()
+            worker.modem.stop()
+        return True
+
+    def __serveClient(self, connection):
+        logger.info("Client connected")
+        try:
+            while True:
+                request = recvFrame(connection.sock)
+                if request is None:
+                    break
+                if not isinstance(request, dict):
+                    connection.send({"id": None, "ok": False, "error": "Invalid request: not an object"})
+                    continue
+                if request.get("op") == "modems":
+                    connection.send({"id": request.get("id"), "ok": True,
+                                     "result": [w.name for w in self.__workers]})
+                    continue
+                name = request.get("modem")
+                worker = self.__workersByName.get(name) if name else self.__workers[0]
+                if worker is None:
+                    connection.send({"id": request.get("id"), "ok": False, "error": "Unknown modem: %s" % name})
+                    continue
+                worker.submit(connection, request)
+        except (socket.error, ValueError) as e:
+            logger.warning("Client error: %s" % e)
+        finally:
+            connection.closed = True
+            connection.sock.close()
+            logger.info("Client disconnected")
+
+
+class Sim800Client(object):
+    """ Client side of the broker protocol.
+    Responses are matched to requests by id, so requests may be pipelined
+    with send() / wait(). Incoming SMS are passed to the callback given
+    to subscribe(), from the client reader thread.
+    """
+    def __init__(self, path, modem=None):
+        self.__modem = modem
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(path)
+        self.__sendLock = threading.Lock()
+        self.__cond = threading.Condition()
+        self.__nextId = 1
+        self.__responses = {}
+        self.__timedOut = set() # ids whose late response is dropped
+        self.__connected = True
+        self.__smsCallback = None
+        self.__reader = threading.Thread(target=self.__readLoop, name="sim800-client")
+        self.__reader.daemon = True
+        self.__reader.start()
+
+    def send(self, op, **args):
+        """Send a request without waiting, returns its id"""
+        with self.__sendLock:
+            requestId = self.__nextId
+            self.__nextId += 1
+            request = dict(args, id=requestId, op=op)
+            if self.__modem and "modem" not in request:
+                request["modem"] = self.__modem
+            sendFrame(self.__socket, request)
+        return requestId
+
+    def wait(self, requestId, timeout=None):
+        """Returns the result of a request, raises IOError on failure"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.__cond:
+            while requestId not in self.__responses:
+                if not self.__connected:
+                    raise IOError("Connection to broker lost")
+                if deadline is None:
+                    self.__cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.__timedOut.add(requestId)
+                        raise IOError("Timeout waiting for broker response")
+                    self.__cond.wait(remaining)
+            response = self.__responses.pop(requestId)
+        if not response.get("ok"):
+            raise IOError(response.get("error"))
+        return response.get("result")
+
+    def call(self, op, **args):
+        return self.wait(self.send(op, **args))
+
+    def close(self):
+        try:
+            self.__socket.shutdown(socket.SHUT_RDWR) # unblock the reader thread
+        except socket.error:
+            pass
+        if self.__reader is not threading.current_thread():
+            self.__reader.join()
+        self.__socket.close()
+
+    def modems(self):
+        return self.call("modems")
+
+    def available(self):
+        return self.call("available")
+
+    def readSms(self):
+        return self.call("readSms")
+
+    def sendSms(self, number, text):
+        return self.call("sendSms", number=number, text=text)
+
+    def httpGet(self, url, deferrable=False):
+        """returns (status, data) like Sim800.httpGet"""
+        return self.__httpResult(self.call("httpGet", url=url, deferrable=deferrable))
+
+    def httpPost(self, url, data, contentType="text/plain", deferrable=False):
+        """returns (status, data) like Sim800.httpPost"""
+        if not isinstance(data, (bytes, bytearray)):
+            data = data.encode("utf-8")
+        return self.__httpResult(self.call("httpPost", url=url, data=_encodeData(data),
+                                           contentType=contentType, deferrable=deferrable))
+
+    def getNetworkState(self, refresh=False):
+        return self.call("networkState", refresh=refresh)
+
+    def subscribe(self, callback):
+        """callback is called with (modem, sender, text) for each incoming SMS"""
+        self.__smsCallback = callback
+        return self.call("subscribe")
+
+    def unsubscribe(self):
+        self.__smsCallback = None
+        return self.call("unsubscribe")
+
+    def __httpResult(self, result):
+        data = result["data"]
+        return (result["status"], bytearray(base64.b64decode(data)) if data else [])
+
+    def __readLoop(self):
+        try:
+            while True:
+                message = recvFrame(self.__socket)
+                if message is None:
+                    break
+                if "event" in message:
+                    if message["event"] == "sms" and self.__smsCallback:
+                        try:
+                            self.__smsCallback(message["modem"], message["sender"], message["text"])
+                        except Exception:
+                            logger.exception("SMS callback failed")
+                    continue
+                with self.__cond:
+                    if message.get("id") in self.__timedOut:
+                        self.__timedOut.discard(message.get("id"))
+                        continue
+                    self.__responses[message.get("id")] = message
+                    self.__cond.notify_all()
+        except (socket.error, ValueError) as e:
+            logger.warning("Broker connection error: %s" % e)
+        finally:
+            with self.__cond:
+                self.__connected = False
+                self.__cond.notify_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Share Sim800 modems over a Unix socket")
+    parser.add_argument("modems", nargs="+",
+                        help="name=device[:resetPin[:powerSupplyResetPin]], eg. gsm0=/dev/ttyS0:27:22")
+    parser.add_argument("--socket", default="/tmp/sim800.sock", help="Unix socket path")
+    parser.add_argument("--monitor", type=int, default=0,
+                        help="Network monitor polling interval in seconds (0: disabled)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    from sim800 import Sim800 # needs the serial port and GPIO libraries
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    modems = []
+    for spec in args.modems:
+        name, _, device = spec.partition("=")
+        fields = device.split(":")
+        pins = [int(p) if p not in ("", "none") else None for p in fields[1:]]
+        modems.append((name, Sim800(fields[0], *pins)))
+
+    broker = Sim800Broker(args.socket, modems)
+    if not broker.begin():
+        return 1
+    if args.monitor:
+        for name, modem in modems:
+            modem.startNetworkMonitor(interval=args.monitor)
+    try:
+        broker.serveForever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
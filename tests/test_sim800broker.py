@@ -0,0 +1,159 @@
+# coding: utf-8
+
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import sim800broker
+from sim800broker import Sim800Broker, Sim800Client, recvFrame, sendFrame
+
+
+class StubModem(object):
+    """Stands for Sim800 in the broker, without serial port"""
+    def __init__(self, smsDelay=0):
+        self.smsDelay = smsDelay
+        self.inbox = []
+        self.failAvailable = 0
+        self.httpCallbacks = []
+        self.__lock = threading.Lock()
+
+    def isOpen(self):
+        return True
+
+    def begin(self, timeout=2):
+        return True
+
+    def stop(self):
+        return True
+
+    def available(self, timeout=None):
+        with self.__lock:
+            if self.failAvailable:
+                self.failAvailable -= 1
+                raise IOError("device disconnected")
+            return len(self.inbox)
+
+    def readSms(self):
+        with self.__lock:
+            return self.inbox.pop(0) if self.inbox else None
+
+    def sendSms(self, number, text):
+        time.sleep(self.smsDelay)
+        return True
+
+    def httpGet(self, url, deferrable=False, callback=None):
+        if deferrable:
+            self.httpCallbacks.append(callback) # answered later, as by the network monitor
+            return None
+        callback(200, bytearray(b"body"))
+        return (200, bytearray(b"body"))
+
+    def getNetworkState(self, refresh=False):
+        return {"rssi": 20}
+
+
+class FramingTest(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def testRoundTrip(self):
+        sendFrame(self.a, {"id": 1, "op": "available"})
+        self.assertEqual(recvFrame(self.b), {"id": 1, "op": "available"})
+
+    def testFrameTooLarge(self):
+        self.a.sendall(struct.pack("!I", sim800broker.MAX_FRAME + 1))
+        self.assertRaises(ValueError, recvFrame, self.b)
+
+    def testPeerClosed(self):
+        self.a.sendall(struct.pack("!I", 10) + b"{")
+        self.a.close()
+        self.assertIsNone(recvFrame(self.b))
+
+
+class BrokerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "sim800.sock")
+        self.slow = StubModem(smsDelay=0.3)
+        self.fast = StubModem()
+        self.broker = Sim800Broker(self.path, [("slow", self.slow), ("fast", self.fast)])
+        self.assertTrue(self.broker.begin())
+        self.server = threading.Thread(target=self.broker.serveForever)
+        self.server.start()
+        self.client = Sim800Client(self.path)
+
+    def tearDown(self):
+        self.client.close()
+        self.broker.stop()
+        self.server.join()
+        shutil.rmtree(self.tmp)
+
+    def testOutOfOrderResponses(self):
+        first = self.client.send("sendSms", modem="slow", number="1", text="a")
+        second = self.client.send("modems")
+        self.assertTrue(self.client.wait(first, timeout=5))
+        self.assertEqual(self.client.wait(second, timeout=5), ["slow", "fast"])
+
+    def testLateResponseDropped(self):
+        requestId = self.client.send("sendSms", modem="slow", number="1", text="a")
+        self.assertRaises(IOError, self.client.wait, requestId, 0.05)
+        time.sleep(0.5)
+        self.assertEqual(self.client.call("networkState", modem="fast"), {"rssi": 20})
+        self.assertRaises(IOError, self.client.wait, requestId, 0.1)
+
+    def testDeferredHttpReply(self):
+        requestId = self.client.send("httpGet", modem="fast", url="http://x", deferrable=True)
+        while not self.fast.httpCallbacks:
+            time.sleep(0.01)
+        self.fast.httpCallbacks.pop()(200, bytearray(b"late"))
+        self.assertEqual(self.client.wait(requestId, timeout=5), {"status": 200, "data": "bGF0ZQ=="})
+
+    def testSmsFanOut(self):
+        received = []
+        client = Sim800Client(self.path, modem="fast")
+        try:
+            client.subscribe(lambda modem, sender, text: received.append((modem, sender, text)))
+            self.fast.inbox.append({"sender": "+33600", "text": "hello"})
+            deadline = time.time() + 5
+            while not received and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            client.close()
+        self.assertEqual(received, [("fast", "+33600", "hello")])
+
+    def testWorkerSurvivesModemError(self):
+        self.client.subscribe(lambda *args: None)
+        self.slow.failAvailable = 1
+        time.sleep(1.5) # let the worker poll and fail
+        self.assertTrue(self.client.wait(self.client.send("sendSms", modem="slow", number="1", text="a"), timeout=5))
+
+    def testInvalidRequest(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        try:
+            payload = b"[1,2]"
+            sock.sendall(struct.pack("!I", len(payload)) + payload)
+            self.assertFalse(recvFrame(sock)["ok"])
+            sendFrame(sock, {"id": 7, "op": "modems"})
+            self.assertEqual(recvFrame(sock), {"id": 7, "ok": True, "result": ["slow", "fast"]})
+        finally:
+            sock.close()
+
+    def testUnknownModem(self):
+        self.assertRaises(IOError, self.client.call, "available", modem="nope")
+
+
+if __name__ == "__main__":
+    unittest.main()